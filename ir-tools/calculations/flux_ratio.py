@@ -8,6 +8,59 @@ from ppdmod.data import set_data, get_all_wavelengths
 from ppdmod.utils import load_data, compute_photometric_slope
 
 
+def get_bin_edges(wavelengths: np.ndarray) -> np.ndarray:
+    """Gets the bin edges of a wavelength grid (of at least two points)
+    from the midpoints between its entries."""
+    if wavelengths.size < 2:
+        raise ValueError("Bin edges need a wavelength grid of at least two points.")
+    half_widths = np.diff(wavelengths)/2
+    return np.concatenate(([wavelengths[0]-half_widths[0]],
+                           wavelengths[:-1]+half_widths,
+                           [wavelengths[-1]+half_widths[-1]]))
+
+
+def resample_flux(new_wl: np.ndarray, old_wl: np.ndarray,
+                  old_flux: np.ndarray) -> np.ndarray:
+    """Resamples a flux onto a new wavelength grid while conserving
+    the integrated flux (see SpectRes, Carnall 2017).
+
+    Notes
+    -----
+    The flux is taken to be constant within each of the old bins, so the
+    integrated flux up to any wavelength is the linear interpolation of the
+    cumulative flux at the old bin edges. Non-finite old bins are left out
+    of both the integral and the covered width, so they do not propagate.
+    New bins are averaged over their covered part only.
+
+    Bins narrower than the old bin they fall in would only pick up that
+    bin's constant value (a staircase), so they, as well as bins without any
+    coverage (e.g., fully outside of the old grid) and single point grids,
+    fall back to np.interp, which is linear and clamps to the edge values.
+    """
+    finite = np.isfinite(old_flux)
+    fallback = np.interp(new_wl, old_wl[finite], old_flux[finite])
+    if new_wl.size < 2:
+        return fallback
+
+    order = np.argsort(new_wl)
+    old_edges, new_edges = get_bin_edges(old_wl), get_bin_edges(new_wl[order])
+    old_index = np.clip(np.searchsorted(old_edges, new_wl[order], side="right")-1,
+                        0, old_wl.size-1)
+    is_narrow = np.diff(new_edges) < np.diff(old_edges)[old_index]
+    new_edges = np.clip(new_edges, old_edges[0], old_edges[-1])
+    widths = np.diff(old_edges)*finite
+    cumulative_flux = np.concatenate(([0], np.cumsum(np.where(finite, old_flux, 0)*widths)))
+    cumulative_width = np.concatenate(([0], np.cumsum(widths)))
+    integrated_flux = np.diff(np.interp(new_edges, old_edges, cumulative_flux))
+    covered_width = np.diff(np.interp(new_edges, old_edges, cumulative_width))
+
+    new_flux = fallback.copy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        new_flux[order] = np.where((covered_width > 0) & ~is_narrow,
+                                   integrated_flux/covered_width, fallback[order])
+    return new_flux
+
+
 def get_flux_ratio(fits_files: List[Path], flux_file: Path) -> np.ndarray:
     """Gets the star's flux interpolated to the provided wavelength grid
     from the (.fits)-files as well as the flux ratio.
@@ -15,7 +68,7 @@ def get_flux_ratio(fits_files: List[Path], flux_file: Path) -> np.ndarray:
     wl, star_flux = load_data(flux_file)
     data = set_data(fits_files, wavelengths="all", wavelength_range=[2.8, 5]*u.um, fit_data=["flux"])
     wavelengths, total_flux = get_all_wavelengths(), data.flux.value.squeeze()
-    star_flux = np.interp(wavelengths.value, wl, star_flux)
+    star_flux = resample_flux(wavelengths.value, wl, star_flux)
     return wavelengths.value, star_flux / total_flux
 
     
@@ -24,6 +77,7 @@ def get_photometric_slope(fits_files: List[Path], flux_file: Path) -> np.ndarray
     set_data(fits_files, wavelengths="all", wavelength_range=[2.8, 5]*u.um, fit_data=["flux"])
     wavelengths = get_all_wavelengths()
     wl, star_flux = load_data(flux_file)
+    # NOTE: The slope needs a smooth interpolant, not bin averages
     star_flux = np.interp(wavelengths.value, wl, star_flux)
     nu = (const.c / wavelengths.to(u.m)).to(u.Hz).value
     return wavelengths.value, np.gradient(np.log(star_flux), np.log(nu))
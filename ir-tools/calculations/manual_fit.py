@@ -1,75 +1,108 @@
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import List, NamedTuple, Optional, Tuple
 
+import astropy.constants as const
 import astropy.units as u
 import matplotlib.pyplot as plt
 import numpy as np
+import pandas as pd
 from astropy.modeling.models import BlackBody
 
+H, C, K_B = const.h.value, const.c.value, const.k_B.value
+
+
+class PanelSpec(NamedTuple):
+    """The data and axis settings of a single panel of the SED plot."""
+    wl: u.Quantity
+    flux: u.Quantity
+    xlabel: str
+    ylabel: str
+    xscale: str = "log"
+    yscale: str = "log"
+
+
+def read_columns(file: Path, **kwargs) -> np.ndarray:
+    """Reads the whitespace separated columns of a text file with pandas' C parser.
+
+    The result is transposed like np.loadtxt(..., unpack=True).
+    """
+    return pd.read_csv(file, sep=r"\s+", header=None, comment="#",
+                       engine="c", **kwargs).to_numpy().T
+
 
 def create_sed(flux_files: List[Path],
                wl_range: Optional[List[u.um]] = [1, 14],
                ) -> Tuple[np.ndarray, np.ndarray]:
     """Create a SED from a list of flux files."""
-    wl, flux = np.array([]), np.array([])
+    wls, fluxes = [], []
     for flux_file in flux_files:
-        data = np.loadtxt(flux_dir / flux_file, unpack=True)
-        wl, flux = np.concatenate((wl, data[0])), np.concatenate((flux, data[1]))
+        data = read_columns(flux_dir / flux_file)
+        wls.append(data[0])
+        fluxes.append(data[1])
+    wl, flux = np.concatenate(wls), np.concatenate(fluxes)
     ind = np.where((wl > wl_range[0]) & (wl < wl_range[1]))
-    return wl[ind]*u.um, flux[ind]*u.Jy
+    return u.Quantity(wl[ind], u.um, copy=False), u.Quantity(flux[ind], u.Jy, copy=False)
 
 
-def calc_blackbody(temperature: u.K, wavelengths: u.um, weight: u.mas) -> np.ndarray:
-    """Calculate the blackbody radiation at a given temperature and wavelength."""
-    scale = 1*u.erg/u.cm**2/u.s/u.AA/u.sr
-    bb = BlackBody(temperature, scale=scale)(wavelengths).to(u.erg/u.cm**2/u.s/u.um/u.sr)
-    return bb*(weight**2).to(u.sr)*np.pi
+def planck_lambda(temperatures: np.ndarray, wavelengths: np.ndarray) -> np.ndarray:
+    """Calculate the spectral radiance B_lambda in SI units (W m^-3 sr^-1)
+    for temperatures (K) and wavelengths (m) given as bare floats.
+
+    The result is of shape (temperatures, wavelengths).
+    """
+    temperatures, wavelengths = temperatures[:, None], wavelengths[None, :]
+    return 2*H*C**2/wavelengths**5/np.expm1(H*C/(wavelengths*K_B*temperatures))
+
+
+def calc_blackbody(temperatures: u.K, wavelengths: u.um, weights: u.mas) -> u.Quantity:
+    """Calculate the blackbody radiation for one or more temperatures
+    and weights at the given wavelengths.
+
+    All components are evaluated in a single broadcasted call, the
+    result is of shape (temperatures, wavelengths), or (wavelengths)
+    for a scalar temperature and weight.
+    """
+    is_scalar = np.ndim(temperatures) == 0 and np.ndim(weights) == 0
+    temperatures = np.atleast_1d(temperatures.to_value(u.K))
+    weights = np.atleast_1d(weights.to_value(u.rad))
+    bb = planck_lambda(temperatures, wavelengths.to_value(u.m))*weights[:, None]**2*np.pi
+    bb = u.Quantity(bb, u.W/u.m**3, copy=False).to(u.erg/u.cm**2/u.s/u.um)
+    return bb[0] if is_scalar else bb
 
 
 def plot_sed(flux_dir: Path) -> Tuple[np.ndarray, np.ndarray]:
     _, axarr = plt.subplots(2, 3, figsize=(15, 10))
-    wl, flux = np.loadtxt(flux_dir / "HD+142666.sed.dat", unpack=True, comments="#", usecols=(1, 2))
-    wl, flux = wl*u.AA, (flux*u.erg/u.s/u.cm**2/u.AA)
+    wl, flux = read_columns(flux_dir / "HD+142666.sed.dat", usecols=[1, 2])
+    wl, flux = u.Quantity(wl, u.AA, copy=False), u.Quantity(flux, u.erg/u.s/u.cm**2/u.AA, copy=False)
     scales = [u.erg/u.s/u.cm**2/u.AA, u.erg/u.s/u.cm**2/u.um, u.erg/u.s/u.cm**2/u.um]
-    labels = [r"Angstrom", "Micron", "Micron"]
-
-    for index_wl in range(2):
-        for index, (scale, label) in enumerate(zip(scales, labels)):
-            if index == 2:
-                ranges = [1, 14]*u.um
-
-                if index_wl == 0:
-                    ranges = ranges.to(u.AA)
-
-                ind = np.where((wl > ranges[0]) & (wl < ranges[1]))
-                tmp_wl, tmp_flx = wl[ind], flux[ind]
-            else:
-                tmp_wl, tmp_flx = wl, flux
-
-            if index != 0:
-                tmp_wl = tmp_wl.to(u.um)
-
-            tmp_flx = tmp_flx.to(scale)
-            if index_wl == 1:
-                tmp_flx *= tmp_wl
-
-            axarr[index_wl, index].scatter(tmp_wl.value, tmp_flx.value)
-            axarr[index_wl, index].set_yscale("log")
-            if not index == 2:
-                axarr[index_wl, index].set_xscale("log")
-            
-            if index_wl == 0:
-                axarr[index_wl, index].set_ylabel(rf"$F_\lambda ({str(scale)})$")
-            else:
-                axarr[index_wl, index].set_ylabel(rf"$\lambda F_\lambda$ ({str(scale*u.um)})")
-
-            axarr[index_wl, index].set_xlabel(rf"$\lambda$ ({label})")
-                
+    xlabels = [rf"$\lambda$ ({label})" for label in ["Angstrom", "Micron", "Micron"]]
+    xscales = ["log", "log", "linear"]
+
+    wl_um, flux_per_ang, flux_per_um = wl.to(u.um), flux.to(scales[0]), flux.to(scales[1])
+    wl_value = wl_um.value
+    ind = np.where((wl_value > 1) & (wl_value < 14))
+    wls = [wl, wl_um, wl_um[ind]]
+    fluxes = [flux_per_ang, flux_per_um, flux_per_um[ind]]
+
+    panel_args = list(zip(wls, fluxes, xlabels, scales, xscales))
+    panels = [PanelSpec(tmp_wl, tmp_flx, xlabel, rf"$F_\lambda ({str(scale)})$", xscale)
+              for tmp_wl, tmp_flx, xlabel, scale, xscale in panel_args]
+    panels += [PanelSpec(tmp_wl, tmp_flx*tmp_wl, xlabel,
+                         rf"$\lambda F_\lambda$ ({str(scale*u.um)})", xscale)
+               for tmp_wl, tmp_flx, xlabel, scale, xscale in panel_args]
+
+    for ax, panel in zip(axarr.flat, panels):
+        ax.scatter(panel.wl.value, panel.flux.value)
+        ax.set_xscale(panel.xscale)
+        ax.set_yscale(panel.yscale)
+        ax.set_xlabel(panel.xlabel)
+        ax.set_ylabel(panel.ylabel)
+
     plt.savefig("sed_combined.pdf", format="pdf")
     plt.close()
 
-    wl, flux = wl.to(u.um), flux.to(u.erg/u.s/u.cm**2/u.um)
-    ind = np.where((wl > 1*u.um) & (wl < 6*u.um))
+    wl, flux = wl_um, flux_per_um
+    ind = np.where((wl_value > 1) & (wl_value < 6))
     wl, flux = wl[ind], flux[ind]
     flux *= wl
 
@@ -77,15 +110,17 @@ def plot_sed(flux_dir: Path) -> Tuple[np.ndarray, np.ndarray]:
     # data = ["HD_142666_timmi2.txt"]
     data = ["HD142666_spitzer_psf.dat"]
     for dataset in data:
-        wl_data, flux_data, *_ = np.loadtxt(flux_dir / dataset, unpack=True, comments="#", skiprows=1)
-        wl_data, flux_data = wl_data*u.um, (flux_data*u.Jy).to(u.erg/u.s/u.cm**2/u.Hz)
+        wl_data, flux_data, *_ = read_columns(flux_dir / dataset, skiprows=1)
+        wl_data = u.Quantity(wl_data, u.um, copy=False)
+        flux_data = u.Quantity(flux_data, u.Jy, copy=False).to(u.erg/u.s/u.cm**2/u.Hz)
         flux_data = flux_data.to(u.erg/u.s/u.cm**2, u.spectral_density(wl_data))
         wl, flux = np.concatenate((wl, wl_data)), np.concatenate((flux, flux_data))
 
     ind = np.argsort(wl)
     wl, flux = wl[ind], flux[ind]
 
-    ind = np.where((wl > 1*u.um) & (wl < 14*u.um))
+    wl_value = wl.value
+    ind = np.where((wl_value > 1) & (wl_value < 14))
     return wl[ind], flux[ind]
 
 
@@ -106,10 +141,10 @@ if __name__ == "__main__":
 
     # temps, ratios = [2100, 1500, 1100, 900, 500], [0.15, 0.7, 1.2, 2.3, 7]
     # wl_range = np.linspace(np.min(wl.value), np.max(wl.value), 300)
-    # bbs = [calc_blackbody(temp*u.K, wl_range*u.um, ratio*u.mas) for temp, ratio in zip(temps, ratios)]
+    # bbs = calc_blackbody(temps*u.K, wl_range*u.um, ratios*u.mas)
 
     # nband = np.where((wl > 8.0*u.um) & (wl < 14.0*u.um))
-    # bb_combined = np.sum(bbs, axis=0)
+    # bb_combined = bbs.sum(axis=0)
     # bb_combined_interpn = np.interp(wl, wl_range*u.um, bb_combined)
     # inner_contribution = (bb_combined_interpn/flux.value)[nband]
     # np.save("flux_ratio_inner_disk_hd142666.npy", np.array([wl[nband], inner_contribution]))
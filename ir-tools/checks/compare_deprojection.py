@@ -25,9 +25,7 @@ def grid(dim: int, pixel_size: float,
 
 def make_ring(rin: float, xx: np.ndarray, yy: np.ndarray) -> np.ndarray:
     radius = np.hypot(xx, yy)
-    radius[radius < rin] = 0
-    radius[radius > (rin+0.5)] = 0
-    return radius
+    return np.where((radius >= rin) & (radius <= rin+0.5), radius, 0)
 
 
 def fourier(image: np.ndarray, pixel_size: float,) -> np.ndarray:
@@ -1,14 +1,47 @@
 import shutil
+from functools import lru_cache, reduce
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional, Tuple, Union
 
 import numpy as np
 from astropy.io import fits
 from matadrs.utils.plot import Plotter
 from tqdm import tqdm
-from uncertainties import unumpy
 
-from utils import average_total_flux, get_model_flux
+from utils import average_total_flux, load_flux_model
+
+
+UNKNOWN_STATION = ""
+
+
+def make_station_lut(sta_index: np.ndarray, sta_name: np.ndarray) -> np.ndarray:
+    """Makes a dense lookup table of the station names indexed
+    by their station indices (from the oi_array).
+
+    Indices without a station are filled with UNKNOWN_STATION.
+    """
+    sta_name = np.asarray(sta_name, dtype=str)
+    lut = np.full(np.max(sta_index)+1, UNKNOWN_STATION, dtype=sta_name.dtype)
+    lut[sta_index] = sta_name
+    return lut
+
+
+def get_station_names(sta_indices: np.ndarray, lut: np.ndarray) -> np.ndarray:
+    """Gets the names of the baselines or triangles (e.g., "A0-B2-C1")
+    from their station indices via the station lookup table.
+
+    Raises
+    ------
+    KeyError
+        If any of the station indices is not in the oi_array.
+    """
+    sta_indices = np.asarray(sta_indices)
+    is_known = (sta_indices >= 0) & (sta_indices < lut.size)
+    is_known[is_known] = lut[sta_indices[is_known]] != UNKNOWN_STATION
+    if not np.all(is_known):
+        raise KeyError(f"Station indices {np.unique(sta_indices[~is_known])}"
+                       " are not in the oi_array.")
+    return reduce(lambda x, y: np.char.add(np.char.add(x, "-"), y), lut[sta_indices].T)
 
 
 def read_gravity_data(file: Path, index: Optional[int] = 10):
@@ -30,55 +63,73 @@ def read_gravity_data(file: Path, index: Optional[int] = 10):
         vcoord = hdul['oi_vis', index].data['vcoord']
 
         # NOTE: Basename
-        dicname = {i: n for i, n in zip(hdul['oi_array'].data['sta_index'],
-                                        hdul['oi_array'].data['sta_name'])}
-        base = [dicname[i]+'-'+dicname[j] for i, j in hdul['oi_vis', index].data['sta_index']]
-        triplet = [dicname[i] + '-'+dicname[j]+'-'+dicname[k] for i, j, k in hdul['oi_t3', index].data['sta_index']]
+        lut = make_station_lut(hdul['oi_array'].data['sta_index'], hdul['oi_array'].data['sta_name'])
+        base = get_station_names(hdul['oi_vis', index].data['sta_index'], lut)
+        triplet = get_station_names(hdul['oi_t3', index].data['sta_index'], lut)
     return wave, spectre, visamp, visphi, closure, ucoord, vcoord, base, triplet
 
 
-def calibrate_gravity_flux(target: Path, calibrator: Path, flux_file: Path,
+@lru_cache(maxsize=8)
+def _read_gravity_flux(file: str, mtime: float) -> Dict[int, Tuple[np.ndarray, ...]]:
+    """Reads the flux of the SC and FT channels (see read_gravity_flux)."""
+    with fits.open(file, "readonly") as hdul:
+        return {index: (hdul["oi_wavelength", index].data["eff_wave"]*1e6,
+                        *(np.array(hdul["oi_flux", index].data[key])
+                          for key in ["flux", "fluxerr", "sta_index"]))
+                for index in [10, 20]}
+
+
+def read_gravity_flux(file: Path) -> Dict[int, Tuple[np.ndarray, ...]]:
+    """Reads the wavelengths (micron), fluxes, flux errors and station
+    indices of the SC (10) and FT (20) channels of the GRAVITY data.
+
+    The result is cached by path and modification time (for the few most
+    recent files), so a calibrator shared by many targets is only read once.
+    The returned arrays are shared between callers and must not be modified.
+    """
+    file = Path(file).resolve()
+    return _read_gravity_flux(str(file), file.stat().st_mtime)
+
+
+def ratio_error_propagation(numerator: np.ndarray, numerator_err: np.ndarray,
+                            denominator: np.ndarray, denominator_err: np.ndarray
+                            ) -> Tuple[np.ndarray, np.ndarray]:
+    """Calculates the ratio of two values and propagates their
+    (uncorrelated) errors analytically."""
+    ratio = numerator/denominator
+    return ratio, np.hypot(numerator_err, ratio*denominator_err)/np.abs(denominator)
+
+
+def calibrate_gravity_flux(target: Path, calibrator: Path,
+                           flux_model: Union[str, Path, Tuple[np.ndarray, np.ndarray]],
                            output_dir: Optional[Path] = None) -> None:
-    """Calibrates the flux of the GRAVITY data."""
+    """Calibrates the flux of the GRAVITY data.
+
+    The flux model can be passed either as a file or as the already
+    loaded (wavelength, flux) arrays, to only read it once for many files.
+    """
+    if isinstance(flux_model, (str, Path)):
+        flux_model = load_flux_model(Path(flux_model))
     output_dir = Path("calibrated") if output_dir is None else output_dir
     if not output_dir.exists():
         output_dir.mkdir(parents=True)
 
     new_file = output_dir / f"{target.stem}_flux_calibrated.fits"
     shutil.copy(target, new_file)
-    with fits.open(target, "readonly") as hdul:
-        wave_sc = hdul['oi_wavelength', 10].data['eff_wave']*1e6
-        wave_ft = hdul['oi_wavelength', 20].data['eff_wave']*1e6
-
-        flux_target_sc = hdul['oi_flux', 10].data['flux']
-        flux_target_sc_err = hdul['oi_flux', 10].data['fluxerr']
-        sta_index_target_sc = hdul['oi_flux', 10].data['sta_index']
-
-        flux_target_ft = hdul['oi_flux', 20].data['flux']
-        flux_target_ft_err = hdul['oi_flux', 20].data['fluxerr']
-        sta_index_target_ft = hdul['oi_flux', 20].data['sta_index']
-
-    with fits.open(calibrator, "readonly") as hdul:
-        flux_cal_sc = hdul['oi_flux', 10].data['flux']
-        flux_cal_sc_err = hdul['oi_flux', 10].data['fluxerr']
-        sta_index_cal_sc = hdul['oi_flux', 10].data['sta_index']
-
-        flux_cal_ft = hdul['oi_flux', 20].data['flux']
-        flux_cal_ft_err = hdul['oi_flux', 20].data['fluxerr']
-        sta_index_cal_ft = hdul['oi_flux', 20].data['sta_index']
-
-    flux_model_sc = get_model_flux(wave_sc, flux_file)
-    flux_model_ft = get_model_flux(wave_ft, flux_file)
-    flux_sc = unumpy.umatrix(flux_target_sc, flux_target_sc_err)/\
-        unumpy.umatrix(flux_cal_sc, flux_cal_sc_err)
-    flux_ft = unumpy.umatrix(flux_target_ft, flux_target_ft_err)/\
-        unumpy.umatrix(flux_cal_ft, flux_cal_ft_err)
-    cal_flux_sc, cal_flux_sc_err = map(lambda x: np.array(x.tolist())*flux_model_sc,
-                                       (unumpy.nominal_values(flux_sc),
-                                        unumpy.std_devs(flux_sc)))
-    cal_flux_ft, cal_flux_ft_err = map(lambda x: np.array(x.tolist())*flux_model_ft,
-                                       (unumpy.nominal_values(flux_ft),
-                                        unumpy.std_devs(flux_ft)))
+    target_flux, calibrator_flux = map(read_gravity_flux, [target, calibrator])
+    wave_sc, flux_target_sc, flux_target_sc_err, sta_index_target_sc = target_flux[10]
+    wave_ft, flux_target_ft, flux_target_ft_err, sta_index_target_ft = target_flux[20]
+    _, flux_cal_sc, flux_cal_sc_err, sta_index_cal_sc = calibrator_flux[10]
+    _, flux_cal_ft, flux_cal_ft_err, sta_index_cal_ft = calibrator_flux[20]
+
+    flux_model_sc = np.interp(wave_sc, *flux_model)
+    flux_model_ft = np.interp(wave_ft, *flux_model)
+    flux_sc = ratio_error_propagation(flux_target_sc, flux_target_sc_err,
+                                      flux_cal_sc, flux_cal_sc_err)
+    flux_ft = ratio_error_propagation(flux_target_ft, flux_target_ft_err,
+                                      flux_cal_ft, flux_cal_ft_err)
+    cal_flux_sc, cal_flux_sc_err = map(lambda x: x*flux_model_sc, flux_sc)
+    cal_flux_ft, cal_flux_ft_err = map(lambda x: x*flux_model_ft, flux_ft)
 
     with fits.open(new_file, "update") as hdul:
         hdul["oi_flux", 10].data["flux"] = cal_flux_sc
@@ -117,9 +168,10 @@ if __name__ == "__main__":
     flux_file = Path("/Users/scheuck/Data/flux_data/hd148605/HD148605_stellar_model.txt")
     sci_dir = Path("/Users/scheuck/Data/reduced_data/hd142666/gravity/fits")
     calibrator = Path("/Users/scheuck/Data/reduced_data/hd142666/gravity/calibrator/HD142666-calibrator.fits")
+    # flux_model = load_flux_model(flux_file)
     # for fits_file in tqdm(list(sci_dir.glob("*fits"))):
     # print(fits_file.name)
-    # calibrate_gravity_flux(fits_file, calibrator, flux_file, output_dir=sci_dir / "calibrated")
+    # calibrate_gravity_flux(fits_file, calibrator, flux_model, output_dir=sci_dir / "calibrated")
     # read_gravity_data(fits_file)
     # make_vis_gravity_files(Path())
     # for fits_file in list((sci_dir / "calibrated").glob("*.fits")):
@@ -1,5 +1,7 @@
-import shutil
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
+from typing import Tuple
 
 import astropy.units as u
 import numpy as np
@@ -9,85 +11,106 @@ from astropy.io import fits
 from tqdm import tqdm
 
 
-def delete_add_ins(file: Path) -> None:
-    """Deletes the oi_flux and oi_vis extensions."""
-    with fits.open(file, mode="update") as hdul:
-        if "oi_vis" in hdul or "oi_flux" in hdul:
-            del hdul["oi_vis"]
-            del hdul["oi_flux"]
+def sqrt_error_propagation(value: np.ndarray, error: np.ndarray
+                           ) -> Tuple[np.ndarray, np.ndarray]:
+    """Calculates the square root of a value and propagates its error
+    analytically, i.e., sigma/(2*sqrt(value)).
 
-
-def calculate_vis(file: Path, wavelength: u.um,
-                  total_flux: u.Jy, total_flux_err: u.Jy,
-                  **kwargs) -> None:
-    """Calculates the correlated fluxes from the
-    squared visibilities and a total flux.
-
-    Also adds the total flux to the file.
+    Non-positive values are clipped to zero and given a nan error.
     """
-    delete_add_ins(file)
-    if not (dir := file.parent / "vis").exists():
-        dir.mkdir(parents=True)
+    sqrt_value = np.sqrt(np.clip(value, 0, None))
+    sqrt_error = np.divide(error, 2*sqrt_value,
+                           out=np.full_like(sqrt_value, np.nan),
+                           where=sqrt_value > 0)
+    return sqrt_value, sqrt_error
 
-    if not (bad_data_dir := file.parent / "bad_data").exists():
-        bad_data_dir.mkdir(parents=True)
 
-    with fits.open(file, mode="readonly") as hdul:
-        vis = hdul["oi_vis2"].copy()
-        vis_header = vis.header.copy()
+def make_vis_hduls(hdul: fits.HDUList, wavelength: u.um,
+                   total_flux: u.Jy, total_flux_err: u.Jy) -> fits.HDUList:
+    """Makes a new HDUList with the visibilities and total flux added.
 
+    The HDUs of the input are referenced, not copied, and the squared
+    visibilities are replaced in place, so the input must be read into
+    memory (memmap=False) to leave the file on disk untouched.
+    """
+    vis2 = hdul["oi_vis2"]
+    vis = vis2.copy()
+    vis_header = vis.header.copy()
     vis_header["EXTNAME"] = "oi_vis".upper()
     vis_header["TTYPE5"] = "visamp".upper()
     vis_header["TTYPE6"] = "visamperr".upper()
     vis.name = "oi_vis".upper()
     vis.columns[4].name = "visamp".upper()
     vis.columns[5].name = "visamperr".upper()
-    vis.data["visamp"] = np.sqrt(vis.data["visamp"])*total_flux*u.Jy
-    vis.data["visamperr"] = quadratic_error_propagation(
+    vis_value, vis_error = sqrt_error_propagation(
             vis.data["visamp"], vis.data["visamperr"])
+    vis.data["visamp"] = vis_value*total_flux*u.Jy
+    vis.data["visamperr"] = vis_error*total_flux*u.Jy
+
+    vis_value, error = sqrt_error_propagation(
+            vis2.data["vis2data"], vis2.data["vis2err"])
+    vis2.data["vis2data"] = vis_value
+    vis2.data["vis2err"] = error
+
+    wavelengths = hdul["oi_wavelength"].data["eff_wave"]
+    flux_header = vis_header.copy()
+    flux_header["EXTNAME"] = "oi_flux".upper()
+    flux = fits.BinTableHDU(
+            QTable({"wavelength": [wavelength*u.um],
+                    "fluxdata": [[total_flux for _ in wavelengths]*u.Jy],
+                    "fluxerr": [[total_flux_err for _ in wavelengths]*u.Jy]}),
+            header=flux_header)
+    return fits.HDUList([hdu for hdu in hdul if hdu.name not in ["OI_VIS", "OI_FLUX"]]
+                        + [vis, flux])
+
 
-    shutil.copy(file, (new_file := dir / f"{file.stem}_vis.fits"))
-    with fits.open(new_file, mode="update") as hdul:
-        if np.max(hdul["oi_vis2"].data["vis2data"] > 1)\
-                or np.min(hdul["oi_vis2"].data["vis2data"] < 0):
-            file.rename(bad_data_dir / file.name)
-            new_file.unlink()
-            return
-
-        vis_value = np.sqrt(hdul["oi_vis2"].data["vis2data"])
-        error = quadratic_error_propagation(
-                vis_value, hdul["oi_vis2"].data["vis2err"])
-
-        hdul["oi_vis2"].data["vis2data"] = vis_value
-        hdul["oi_vis2"].data["vis2err"] = error
-        hdul.append(vis)
-
-        wavelengths = hdul["oi_wavelength"].data["eff_wave"]
-        flux_header = vis_header.copy()
-        flux_header["EXTNAME"] = "oi_flux".upper()
-        flux = fits.BinTableHDU(
-                QTable({"wavelength": [wavelength*u.um],
-                        "fluxdata": [[total_flux for _ in wavelengths]*u.Jy],
-                        "fluxerr": [[total_flux_err for _ in wavelengths]*u.Jy]}),
-                header=flux_header)
-        hdul.append(flux)
-        hdul.flush()
-
-    if not (plot_dir := file.parent / "plots").exists():
-        plot_dir.mkdir(parents=True)
-    if not (new_plot_dir := new_file.parent / "plots").exists():
-        new_plot_dir.mkdir(parents=True)
+def calculate_vis(file: Path, wavelength: u.um,
+                  total_flux: u.Jy, total_flux_err: u.Jy,
+                  overwrite: bool = False, **kwargs) -> None:
+    """Calculates the correlated fluxes from the
+    squared visibilities and a total flux.
+
+    Also adds the total flux to the file. Files that have already been
+    processed or flagged as bad data are skipped unless overwrite is set.
+    """
+    (dir := file.parent / "vis").mkdir(parents=True, exist_ok=True)
+    (bad_data_dir := file.parent / "bad_data").mkdir(parents=True, exist_ok=True)
+
+    new_file = dir / f"{file.stem}_vis.fits"
+    if not overwrite and (new_file.exists() or (bad_data_dir / file.name).exists()):
+        return
+
+    with fits.open(file, mode="readonly", memmap=False) as hdul:
+        vis2data = hdul["oi_vis2"].data["vis2data"]
+        is_bad_data = np.max(vis2data > 1) or np.min(vis2data < 0)
+        if not is_bad_data:
+            make_vis_hduls(hdul, wavelength, total_flux,
+                           total_flux_err).writeto(new_file, overwrite=True)
+
+    if is_bad_data:
+        file.rename(bad_data_dir / file.name)
+        return
+
+    (plot_dir := file.parent / "plots").mkdir(parents=True, exist_ok=True)
+    (new_plot_dir := new_file.parent / "plots").mkdir(parents=True, exist_ok=True)
     original_plot = Plotter(file, save_path=plot_dir)
     new_plot = Plotter(new_file, save_path=new_plot_dir)
     original_plot.add_uv().add_vis2().add_cphases().plot(**kwargs)
     new_plot.add_uv().add_vis2().add_cphases().plot(**kwargs)
 
 
+def plot_mosaic(file: Path, **kwargs) -> None:
+    """Plots the mosaic of a (.fits)-file next to it."""
+    plot = Plotter(file, save_path=file.parent)
+    plot.add_mosaic().plot(**kwargs)
+
+
 if __name__ == "__main__":
     pionier_dir = Path("/Users/scheuck/Data/reduced_data/hd142666/pionier")
     directory = pionier_dir / "nChannels6" / "non_kraus"
-    for index, fits_file in enumerate(tqdm(list(directory.glob("*.fits")))):
-        # delete_add_ins(fits_file)
-        # calculate_vis(fits_file, 1.662, 2.06, 0.05, margin=0.3, error=True, save=True)
-        plot = Plotter(fits_file, save_path=fits_file.parent)
-        plot.add_mosaic().plot(margin=0.3, error=True, save=True)
+    fits_files = list(directory.glob("*.fits"))
+    # process = partial(calculate_vis, wavelength=1.662, total_flux=2.06,
+    #                   total_flux_err=0.05, margin=0.3, error=True, save=True)
+    process = partial(plot_mosaic, margin=0.3, error=True, save=True)
+    with ProcessPoolExecutor() as executor:
+        list(tqdm(executor.map(process, fits_files), total=len(fits_files)))
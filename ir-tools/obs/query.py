@@ -1,13 +1,20 @@
+import re
+from pathlib import Path
 from pprint import pprint
 
 import astropy.units as u
 import matplotlib.pyplot as plt
 import numpy as np
+from astropy.table import Table
 from astropy.time import Time
 from astroquery.ipac.irsa import Irsa
 from astroquery.vizier import Vizier
 
 
+CACHE_DIR = Path.home() / ".cache" / "ir-tools"
+WISE_COLUMN = re.compile(r"W[1-4]")
+
+
 def wise_to_flux(flux: float, lband: bool):
     if lband:
         return np.round(309.54 * 10.0 ** (-flux / 2.5), 2)
@@ -22,7 +29,7 @@ def query_and_filter_catalogs(object_name: str, radius=1*u.arcsec):
     multi_epoch_catalogs = []
     
     for catalog in catalogs:
-        has_wise_columns = any(col for col in catalog.colnames if any(f"W{index}" in col for index in range(1, 5)))
+        has_wise_columns = any(map(WISE_COLUMN.search, catalog.colnames))
         
         # has_multiple_epochs(catalog):
         if has_wise_columns:
@@ -30,32 +37,51 @@ def query_and_filter_catalogs(object_name: str, radius=1*u.arcsec):
     
     return multi_epoch_catalogs
 
+
+def query_wise(object_name: str, radius: u.arcsec = 1*u.arcsec,
+               refresh: bool = False) -> Table:
+    """Query the multi epoch WISE catalog for the specified object.
+
+    The result is cached to disk and read from there on subsequent
+    calls, unless a refresh is requested. Empty results are not cached.
+    """
+    cache_file = CACHE_DIR / "irsa" \
+        / f"{object_name.replace(' ', '_')}_{radius.to_value(u.arcsec)}.ecsv"
+    if cache_file.exists() and not refresh:
+        return Table.read(cache_file, format="ascii.ecsv")
+
+    wise = Irsa.query_region(object_name, catalog="allwise_p3as_mep",
+                             spatial="Cone", radius=radius)
+    if len(wise) == 0:
+        return wise
+
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    wise.write(cache_file, format="ascii.ecsv", overwrite=True)
+    return wise
+
+
 # TODO: Check AKARI as well for the targets
 def query_catalog(object_name: str, catalog: str,
-                  index: int):
+                  index: int, refresh: bool = False):
     """Query the specified catalog for the specified object
     from a multi epoch catalog."""
     if catalog == "wise":
-        wise = Irsa.query_region(object_name, catalog="allwise_p3as_mep",
-                                  spatial="Cone", radius=1*u.arcsec)
+        wise = query_wise(object_name, refresh=refresh)
+        wise.sort("mjd")
 
         w, w_err = wise[f"w{index}mpro_ep"], wise[f"w{index}sigmpro_ep"]
         # w_err_ratio = w_err / w
 
         labels = Time(wise["mjd"].data, format="mjd")
-        ind = np.argsort(labels)
-        labels = labels[ind]
-        w, w_err = w[ind], w_err[ind]
-        isot = [label.isot for label in labels]
-        data = {k: {"time": [], "value": [], "error": []}
-                for k in np.unique([iso.split("T")[0] for iso in isot])}
-
-        for w_entry, w_err_entry, iso in zip(w, w_err, isot):
-            key, time = iso.split("T")
-            data[key]["time"].append(time)
-            data[key]["value"].append(w_entry)
-            data[key]["error"].append(w_err_entry)
-    return {k: {ki: np.array(vi) for ki, vi in v.items()} for k, v in data.items()}
+        isot = np.char.partition(labels.isot.astype(str), "T")
+        dates, times = isot[:, 0], isot[:, 2]
+
+        # NOTE: The dates are sorted, so each epoch is a contiguous slice
+        keys, starts = np.unique(dates, return_index=True)
+        splits = [np.split(np.asarray(x), starts[1:]) for x in (times, w, w_err)]
+        data = {key: {"time": time, "value": value, "error": error}
+                for key, time, value, error in zip(keys, *splits)}
+    return data
 
 
 def plot_multi_epoch(object_name: str) -> None:
@@ -48,6 +48,7 @@ def plot_individual_grains(file_dir: Path, continuum_file: Path,
     indices = np.where((wl > wavelength_range[0])
                        & (wl < wavelength_range[1]))
 
+    colormap = plt.get_cmap(cmap)
     text_kwargs = {"fontsize": 14, "va": "center"}
     _, axarr = plt.subplots(len(names)+1, 1,
                               figsize=(12, 10), sharex=True)
@@ -60,7 +61,7 @@ def plot_individual_grains(file_dir: Path, continuum_file: Path,
         for i, dat in enumerate(tmp_data):
             ax.plot(wl.flatten()[indices], dat.flatten()[indices],
                     label=rf"{size[i]} $\mu$m", ls=linestyles[i],
-                    c=plt.get_cmap(cmap)(i))
+                    c=colormap(i))
         if index == 2:
             ax.set_ylabel(r"$\kappa$ ($cm^{2}g^{-1}$)")
         ax.text(0.5, 0.8, label.title(), ha="center",
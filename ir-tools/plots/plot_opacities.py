@@ -31,6 +31,9 @@ def make_overview_plot(grains, f_maxs, gs_sizes, qval_files):
         axarr[index].set_title(plot_title)
         axarr[index].legend()
 
+    for unused_ax in axarr[len(grains):]:
+        unused_ax.remove()
+
     fig.suptitle("Overview: Optical depths")
     penultimate_plot = axarr.shape[0]-2
     axarr[penultimate_plot].set_xlabel(r"Wavelength ($\mu$m)")
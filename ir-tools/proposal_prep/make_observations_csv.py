@@ -1,5 +1,8 @@
+import hashlib
+import pickle
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Optional
 
 import pandas as pd
 from matadrs.utils.readout import ReadoutFits
@@ -8,13 +11,19 @@ from matadrs.utils.readout import ReadoutFits
 STATIONS_TO_NAME = {"A0-B2-C1-D0": "small", "D0-G2-J3-K0": "medium",
                     "A0-G1-J2-J3": "large", "UT1-UT2-UT3-UT4": "UTs"}
 NAME_TO_STATIONS = {v: k for k, v in STATIONS_TO_NAME.items()}
+CACHE_DIR = Path.home() / ".cache" / "ir-tools" / "observations"
+CACHE_VERSION = 1
 
 
 def set_data(path: Path) -> Dict:
     """Sets the data for the pandas dataframe."""
     data = {"Instrument": [], "Date": [], "Seeing": [], "tau_0": [],
             "Stations": []}
-    for readout in list(map(ReadoutFits, path.glob("*.fits"))):
+    fits_files = list(path.glob("*.fits"))
+    with ThreadPoolExecutor(max_workers=max(1, min(8, len(fits_files)))) as executor:
+        readouts = list(executor.map(ReadoutFits, fits_files))
+
+    for readout in readouts:
         data["Instrument"].append(readout.instrument.upper())
         data["Date"].append(" ".join(readout.tpl_start.split("T"))[:-3])
         data["Seeing"].append(round(readout.seeing, 1))
@@ -25,6 +34,37 @@ def set_data(path: Path) -> Dict:
     return data
 
 
+def load_or_set_data(path: Path, cache_dir: Optional[Path] = None) -> Dict:
+    """Loads the data from a pickled cache or sets and caches it.
+
+    Notes
+    -----
+    There is one cache file per data directory, which is overwritten
+    whenever it is rebuilt, so stale entries do not pile up. It is
+    rebuilt as soon as any of the (.fits)-files change (name or
+    modification time) or the CACHE_VERSION is bumped, which needs
+    to be done whenever the layout of the data set by "set_data" changes.
+    """
+    cache_dir = CACHE_DIR if cache_dir is None else Path(cache_dir)
+    fits_files = sorted(path.glob("*.fits"))
+    key = hashlib.sha1(f"v{CACHE_VERSION}".encode())
+    for fits_file in fits_files:
+        key.update(f"{fits_file.resolve()}{fits_file.stat().st_mtime}".encode())
+    key = key.hexdigest()
+    cache_file = cache_dir / f"{hashlib.sha1(str(path.resolve()).encode()).hexdigest()}.pkl"
+    if cache_file.exists():
+        with open(cache_file, "rb") as file:
+            cached_key, data = pickle.load(file)
+        if cached_key == key:
+            return data
+
+    data = set_data(path)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    with open(cache_file, "wb") as file:
+        pickle.dump((key, data), file)
+    return data
+
+
 def create_dataframe(data: Dict) -> pd.DataFrame:
     """Creates the pandas dataframe."""
     df = pd.DataFrame(data)
@@ -34,6 +74,6 @@ def create_dataframe(data: Dict) -> pd.DataFrame:
 
 if __name__ == "__main__":
     fitting_dir = Path("/Users/scheuck/Data/reduced_data/hd142666/fitting_data")
-    data = set_data(fitting_dir)
+    data = load_or_set_data(fitting_dir)
     print(create_dataframe(data))
     # df.to_csv("observations.csv", index=False)
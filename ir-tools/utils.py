@@ -56,20 +56,16 @@ def remove_flawed_telescope(fits_file: Path, telescopes: List[str],
     with fits.open(new_file, "update") as hdul:
         sta_indices = dict(zip(hdul["oi_array"].data["tel_name"],
                                hdul["oi_array"].data["sta_index"]))
-        for telescope in telescopes:
-            sta_index = sta_indices[telescope]
-            for entry in hdul:
-                if entry.data is None:
-                    continue
-                if "STA_INDEX" not in entry.columns.names:
-                    continue
-                data = entry.data["sta_index"]
-                if len(data.shape) == 1:
-                    mask = data != sta_index
-                    entry.data = entry.data[mask]
-                else:
-                    mask = np.any(data == sta_index, axis=1)
-                    entry.data = entry.data[~mask]
+        flawed_indices = [sta_indices[telescope] for telescope in telescopes]
+        for entry in hdul:
+            if entry.data is None:
+                continue
+            if "STA_INDEX" not in entry.columns.names:
+                continue
+            mask = np.isin(entry.data["sta_index"], flawed_indices)
+            if len(mask.shape) != 1:
+                mask = np.any(mask, axis=1)
+            entry.data = entry.data[~mask]
         hdul.flush()
     plot = Plotter(new_file, save_path=fits_file.parent)
     unwrap = True if "AQUARIUS" in new_file.name else False